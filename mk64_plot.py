@@ -1,146 +1,114 @@
 import os
+import re
+import glob
 import json
-import tempfile
+import itertools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
-from plotly.subplots import make_subplots
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
 # ==========================
 # CONFIG
 # ==========================
-SHEET_NAME = os.environ["SHEET_NAME"]
-WORKSHEET_NAME = os.environ["WORKSHEET_NAME"]
 EXPORT_IMAGE = False               # You can still enable PNG export
 EXPORT_HTML = True                 # Interactive HTML version
 OUTPUT_DIR = "charts"             # Folder for generated charts
+CACHE_PREFIX = ".cache_"          # Parquet snapshot of the sheet, kept in OUTPUT_DIR
+DATE_FORMAT = "%m/%d/%Y"           # How the sheet's Date column is formatted
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Styling for the record table written under each chart
+TABLE_CSS = (
+    ".record-table {border-collapse: collapse; width: 100%; font: 11px sans-serif;}"
+    ".record-table th {background: #EEEEEE; font-size: 12px; text-align: left; padding: 4px 8px;}"
+    ".record-table td {text-align: left; padding: 4px 8px; border-top: 1px solid #DDDDDD;}"
+)
 
 # ==========================
-# GOOGLE SHEETS CONNECTION
+# TIME CONVERSION
 # ==========================
-scope = ["https://spreadsheets.google.com/feeds",
-         "https://www.googleapis.com/auth/drive"]
-
-if "GSPREAD_SA_JSON" in os.environ:
-    # Running in GitHub Actions
-    sa_info = json.loads(os.environ["GSPREAD_SA_JSON"])
-
-    with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".json") as f:
-        json.dump(sa_info, f)
-        sa_path = f.name
-
-    creds = ServiceAccountCredentials.from_json_keyfile_name(sa_path, scope)
-
-else:
-    # Running locally
-    creds = ServiceAccountCredentials.from_json_keyfile_name(
-        "service_account.json", scope
+def seconds_to_mmsscc(secs):
+    # Format a whole array of seconds as "m:ss.cc" strings at once
+    cc = np.round(np.asarray(secs, dtype=float) * 100).astype(np.int64)
+    m, cc = np.divmod(cc, 6000)
+    s, cc = np.divmod(cc, 100)
+    return np.char.add(
+        np.char.add(m.astype(str), ":"),
+        np.char.add(np.char.zfill(s.astype(str), 2),
+                    np.char.add(".", np.char.zfill(cc.astype(str), 2)))
     )
 
-client = gspread.authorize(creds)
-sheet = client.open(SHEET_NAME).worksheet(WORKSHEET_NAME)
-
-data = pd.DataFrame(sheet.get_all_records())
-
 # ==========================
-# TIME CONVERSION
+# AXES HELPERS
 # ==========================
-def mmsscc_to_seconds(t):
-    m, rest = t.split(":")
-    s, cc = rest.split(".")
-    return int(m)*60 + int(s) + int(cc)/100
+def choose_tick_step(span):
+    if span <= 0.6:
+        return 0.05 
+    elif span <= 1.5:
+        return 0.1
+    elif span <= 3:
+        return 0.25
+    elif span <= 6:
+        return 0.5
+    else:
+        return 1.0
+
+def generate_ticks(min_val, max_val, step):
+    start = np.floor(min_val / step) * step
+    return np.round(np.arange(start, max_val + 1e-6, step), 3)
 
-def seconds_to_mmsscc(sec):
-    m = int(sec // 60)
-    s = int(sec % 60)
-    cc = int(round((sec - int(sec)) * 100))
-    return f"{m}:{s:02}.{cc:02}"
-
-data["Date"] = pd.to_datetime(data["Date"])
-data["Time_sec"] = data["Time"].apply(mmsscc_to_seconds)
 
 # ==========================
-# LOOP THROUGH TRACKS
+# RENDER ONE TRACK
 # ==========================
-for track in data["Track"].unique():
-    TRACK_SELECTED = track
-    df = data[data["Track"] == TRACK_SELECTED].sort_values("Date").reset_index(drop=True)
-    
-    df["DateStr"] = df["Date"].dt.strftime("%m-%d-%y")
-    df["Best_Time"] = df["Time_sec"].cummin()
-    
-    # Identify record breaks
-    record_df = df[df["Time_sec"] == df["Best_Time"]].copy()
-
-    # Build step ranges (start → next change)
-    record_df["End_Date"] = record_df["Date"].shift(-1)
-    record_df.loc[record_df.index[-1], "End_Date"] = record_df["Date"].iloc[-1]
-
-    # String dates for categorical axis
-    record_df["StartStr"] = record_df["Date"].dt.strftime("%m-%d-%y")
-    record_df["EndStr"] = record_df["End_Date"].dt.strftime("%m-%d-%y")
+def render_track(track, df, color_map):
+    df = df.reset_index(drop=True)
+
+    # Per-row values pulled out once as NumPy arrays and reused below
+    date_strs = df["DateStr"].to_numpy()
+    best_times = df["Best_Time"].to_numpy()
+    players = df["Player"].to_numpy()
+
+    # Positions of rows that match the running best (record set or tied)
+    record_pos = np.flatnonzero(df["Time_sec"].to_numpy() == best_times)
 
     # ==========================
     # CHART
     # ==========================
-    fig = make_subplots(
-        rows=2,
-        cols=1,
-        shared_xaxes=False,
-        row_heights=[0.65, 0.35],
-        vertical_spacing=0.08,
-        specs=[
-            [{"type": "scatter"}],
-            [{"type": "table"}]
-        ]
-    )
-
-    palette = px.colors.qualitative.Dark24
-    color_map = dict(zip(df["Player"].unique(), palette))
-
-    # Indices where a new record is set
+    fig = go.Figure()
 
-    record_points = df[df["Best_Time"].diff() != 0]
+    # Rows where a new record is set
+    record_points = df[df["IsRecord"]]
 
-    shown_players = set()
+    # Each segment runs from one record row to the next
+    seg_ends = np.r_[record_pos[1:], len(df) - 1]
 
-    for i in range(len(record_df)):
-        row = record_df.iloc[i]
+    # Collect every segment per holder, separated by gaps, so each holder is one trace
+    holder_x = {}
+    holder_y = {}
 
-        start_idx = df.index.get_loc(row.name)
-
-        if i < len(record_df) - 1:
-            next_row = record_df.iloc[i + 1]
-            end_idx = df.index.get_loc(next_row.name)
-        else:
-            end_idx = len(df) - 1
-
-        seg = df.iloc[start_idx:end_idx + 1]
-
-        holder = row["Player"]
-        show_legend = holder not in shown_players
-        shown_players.add(holder)
+    for start_idx, end_idx in zip(record_pos, seg_ends):
+        holder = players[start_idx]
+        holder_x.setdefault(holder, []).extend([date_strs[start_idx:end_idx + 1], [None]])
+        holder_y.setdefault(holder, []).extend([best_times[start_idx:end_idx + 1], [np.nan]])
 
+    for holder in holder_x:
         fig.add_trace(go.Scatter(
-            x=seg["DateStr"],
-            y=seg["Best_Time"],
+            x=np.concatenate(holder_x[holder]),
+            y=np.concatenate(holder_y[holder]),
             mode="lines",
             name=holder,
-            showlegend=show_legend,
             hoverinfo="skip",
             line=dict(
                 shape="hv",
                 width=4,
                 color=color_map[holder]
             ),
-        ),
-        row=1,
-        col=1
+        )
     )
 
     fig.add_trace(go.Scatter(
@@ -160,14 +128,12 @@ for track in data["Track"].unique():
             "Time: %{customdata[2]}"
             "<extra></extra>"
         ),
-        customdata=list(zip(
-            record_points["DateStr"],
-            record_points["Player"],
-            record_points["Best_Time"].map(seconds_to_mmsscc)
-        ))
-        ),
-        row=1,
-        col=1
+        customdata=np.column_stack([
+            record_points["DateStr"].to_numpy(dtype=object),
+            record_points["Player"].to_numpy(dtype=object),
+            seconds_to_mmsscc(record_points["Best_Time"]).astype(object)
+        ])
+        )
     )
 
     # ==========================
@@ -177,59 +143,15 @@ for track in data["Track"].unique():
     table_df = table_df.sort_values("Best_Time", ascending=True)
 
     table_df["Date"] = table_df["Date"].dt.strftime("%m-%d-%y")
-    table_df["Time"] = table_df["Best_Time"].apply(seconds_to_mmsscc)
+    table_df["Time"] = seconds_to_mmsscc(table_df["Best_Time"])
 
     table_df = table_df[["Date", "Player", "Time"]]
 
-    fig.add_trace(
-        go.Table(
-            header=dict(
-                values=["Date", "Player", "Time"],
-                fill_color="#EEEEEE",
-                align="left",
-                font=dict(size=12, color="black")
-            ),
-            cells=dict(
-                values=[
-                    table_df["Date"],
-                    table_df["Player"],
-                    table_df["Time"]
-                ],
-                fill_color="white",
-                align="left",
-                font=dict(size=11)
-            )
-        ),
-        row=2,
-        col=1
-    )
-        
     # ==========================
     # AXES & FORMATTING
     # ==========================
-    def choose_tick_step(span):
-        if span <= 0.6:
-            return 0.05 
-        elif span <= 1.5:
-            return 0.1
-        elif span <= 3:
-            return 0.25
-        elif span <= 6:
-            return 0.5
-        else:
-            return 1.0
-
-    def generate_ticks(min_val, max_val, step):
-        start = (int(min_val / step)) * step
-        ticks = []
-        val = start
-        while val <= max_val + 1e-6:
-            ticks.append(round(val, 3))
-            val += step
-        return ticks
-
-    y_min = df["Best_Time"].min()
-    y_max = df["Best_Time"].max()
+    y_min = best_times.min()
+    y_max = best_times.max()
 
     padding = max(0.2, (y_max - y_min) * 0.15)
     y_lo = y_min - padding
@@ -238,15 +160,13 @@ for track in data["Track"].unique():
     span = y_hi - y_lo
     step = choose_tick_step(span)
 
-    first_date_rows = df.loc[
-        df["DateStr"].ne(df["DateStr"].shift())
-    ]
+    first_date_rows = df.drop_duplicates("DateStr", keep="first")
 
     x_tick_vals = first_date_rows["DateStr"].tolist()
     x_tick_text = x_tick_vals
 
     y_tick_vals = generate_ticks(y_lo, y_hi, step)
-    y_tick_labels = [seconds_to_mmsscc(t) for t in y_tick_vals]
+    y_tick_labels = seconds_to_mmsscc(y_tick_vals)
 
     x_dates = df["Date"].dt.strftime("%m-%d-%y")
 
@@ -269,23 +189,130 @@ for track in data["Track"].unique():
         tickvals=x_tick_vals,
         ticktext=x_tick_text,
         tickangle=-30,
-        title="Date",
-        row=1,
-        col=1
+        title="Date"
     )
 
     fig.update_layout(
-        title=f"{TRACK_SELECTED} – Record Progression",
+        title=f"{track} – Record Progression",
         hovermode="closest",
         legend_title="Record Holder",
         template="seaborn",
-        height=1200,
+        height=780,
         margin=dict(t=60, b=40)
     )
 
     # ==========================
     # EXPORT
     # ==========================
-    safe_name = TRACK_SELECTED.lower().replace(" ", "_")
-    output_path = os.path.join(OUTPUT_DIR, f"{safe_name}.html")
-    fig.write_html(output_path)
\ No newline at end of file
+    safe_name = track.lower().replace(" ", "_")
+    output_path = Path(OUTPUT_DIR) / f"{safe_name}.html"
+
+    # Record table is plain HTML below the chart rather than a Plotly trace.
+    # The figure was built from validated graph objects, so skip re-validating it.
+    chart_html = fig.to_html(full_html=False, include_plotlyjs="cdn", validate=False)
+    table_html = table_df.to_html(index=False, classes="record-table", border=0)
+
+    output_path.write_text(
+        "<html>\n"
+        f"<head><meta charset=\"utf-8\" /><style>{TABLE_CSS}</style></head>\n"
+        f"<body>\n{chart_html}\n{table_html}\n</body>\n"
+        "</html>\n",
+        encoding="utf-8"
+    )
+
+
+# ==========================
+# LOAD SHEET DATA
+# ==========================
+def load_data(sheet_name, worksheet_name):
+    # ==========================
+    # GOOGLE SHEETS CONNECTION
+    # ==========================
+    scope = ["https://spreadsheets.google.com/feeds",
+             "https://www.googleapis.com/auth/drive"]
+
+    if "GSPREAD_SA_JSON" in os.environ:
+        # Running in GitHub Actions
+        sa_info = json.loads(os.environ["GSPREAD_SA_JSON"])
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(sa_info, scope)
+
+    else:
+        # Running locally
+        creds = ServiceAccountCredentials.from_json_keyfile_name(
+            "service_account.json", scope
+        )
+
+    client = gspread.authorize(creds)
+    spreadsheet = client.open(sheet_name)
+
+    # ==========================
+    # SHEET CACHE
+    # ==========================
+    # Key the snapshot on the sheet's Drive revision so unchanged data skips the fetch
+    sheet_rev = re.sub(r"\W", "", f"{worksheet_name}_{spreadsheet.get_lastUpdateTime()}")
+    cache_path = os.path.join(OUTPUT_DIR, f"{CACHE_PREFIX}{sheet_rev}.parquet")
+
+    if os.path.exists(cache_path):
+        data = pd.read_parquet(cache_path)
+    else:
+        sheet = spreadsheet.worksheet(worksheet_name)
+        header, *rows = sheet.get_all_values()
+        data = pd.DataFrame(rows, columns=header)
+
+        # Drop snapshots of older revisions before writing the new one
+        for stale_path in glob.glob(os.path.join(OUTPUT_DIR, f"{CACHE_PREFIX}*.parquet")):
+            os.remove(stale_path)
+        data.to_parquet(cache_path, compression="zstd", index=False)
+
+    # ==========================
+    # TIME CONVERSION
+    # ==========================
+    data["Date"] = pd.to_datetime(data["Date"], format=DATE_FORMAT)
+
+    # Split "m:ss.cc" into minute / second / centisecond columns in one pass
+    time_parts = data["Time"].str.split(r"[:.]", expand=True, regex=True).astype(np.int32)
+    data["Time_sec"] = time_parts[0]*60 + time_parts[1] + time_parts[2]/100
+
+    # ==========================
+    # PREPARE TRACK DATA
+    # ==========================
+    # Low-cardinality labels: group and compare on integer codes, not strings
+    for col in ("Track", "Player"):
+        data[col] = data[col].astype("category")
+
+    # Sort once up front; each track group then comes out already in date order
+    data = data.sort_values("Date", kind="stable").reset_index(drop=True)
+
+    # Per-track running best and record flags, computed for every track in one pass
+    data["DateStr"] = data["Date"].dt.strftime("%m-%d-%y")
+    data["Best_Time"] = data.groupby("Track", sort=False, observed=True)["Time_sec"].cummin()
+    data["IsRecord"] = data.groupby("Track", sort=False, observed=True)["Best_Time"].diff() != 0
+
+    return data
+
+
+# ==========================
+# MAIN
+# ==========================
+def main(sheet_name, worksheet_name):
+    # Ensure output directory exists
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    data = load_data(sheet_name, worksheet_name)
+
+    # One colour per player across every track page
+    palette = px.colors.qualitative.Dark24
+    color_map = dict(zip(data["Player"].unique(), itertools.cycle(palette)))
+
+    # ==========================
+    # RENDER TRACKS IN PARALLEL
+    # ==========================
+    # Each track is independent once the data is loaded, so fan them out across cores
+    tracks, track_frames = zip(*data.groupby("Track", sort=False, observed=True))
+
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(render_track, tracks, track_frames, itertools.repeat(color_map)))
+
+
+if __name__ == "__main__":
+    main(os.environ["SHEET_NAME"], os.environ["WORKSHEET_NAME"])